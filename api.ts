@@ -224,10 +224,22 @@ export const optimizeApi = {
 
 export const historyApi = {
 
-  /** Fetch all sessions for the logged-in user, newest first. */
+  /**
+   * Fetch all sessions for the logged-in user, newest first.
+   * Flask pages the history list, so we follow next_cursor until it runs out.
+   */
   getAll: async (): Promise<SessionRecord[]> => {
-    const data = await apiFetch<{ sessions: SessionRecord[] }>('/api/history');
-    return data.sessions;
+    const sessions: SessionRecord[] = [];
+    let cursor: string | null = null;
+    do {
+      const query = `?limit=200${cursor ? `&cursor=${cursor}` : ''}`;
+      const data = await apiFetch<{ sessions: SessionRecord[]; next_cursor: string | null }>(
+        `/api/history${query}`,
+      );
+      sessions.push(...data.sessions);
+      cursor = data.next_cursor;
+    } while (cursor);
+    return sessions;
   },
 
   /** Delete a session by its MongoDB _id. */
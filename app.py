@@ -6,11 +6,11 @@ Endpoints
 ─────────
 POST /api/auth/register        — create account
 POST /api/auth/login           — get JWT token
-GET  /api/auth/me              — get current user info  (requires token)
+GET  /api/auth/me              — get current user info  (requires token, ?fresh=1 reads DB)
 
 POST /api/analyse              — run optimization       (requires token)
 
-GET  /api/history              — get all sessions       (requires token)
+GET  /api/history              — list sessions, paged   (requires token)
 DELETE /api/history/<id>       — delete a session       (requires token)
 PATCH  /api/history/<id>/rename — rename a session      (requires token)
 PATCH  /api/history/<id>/star  — toggle star            (requires token)
@@ -18,23 +18,57 @@ PATCH  /api/history/<id>/star  — toggle star            (requires token)
 GET  /api/profile/stats        — aggregated stats       (requires token)
 
 GET  /api/health               — liveness probe
+
+Concurrency
+───────────
+The app stays a threaded WSGI (Flask + PyMongo) service. The CPU-bound
+pipeline levels ("none", "level1") run in a pool of worker processes
+(_PIPELINE_POOL), so they don't hold the GIL against auth/history requests.
+"level2" is mostly waiting on LLM calls, so its coroutine runs on one shared
+background event loop (_LOOP) and isn't capped by the pool size.
+
+Requests stop waiting after PIPELINE_TIMEOUT and get a 504, but a pool job
+that is already running keeps its worker busy until it finishes, and a
+cancelled level2 coroutine leaves its in-flight LLM calls running in their
+executor threads. Password hashing goes through its own bounded pool
+(_HASH_POOL).
 """
 
 import asyncio
+import multiprocessing
+import threading
+import time
 import traceback
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 
 import bcrypt
 import jwt as pyjwt
+import orjson
+from cachetools import TTLCache
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from datetime import datetime, timedelta, timezone
-from functools import wraps
+from functools import cache, wraps
+
+from bson import ObjectId
+from bson.errors import InvalidId
 
-from flask import Flask, jsonify, request, g
+from flask import Flask, Response, jsonify, request, g
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from flask_cors import CORS
+from pymongo.errors import DuplicateKeyError
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from database import (
+    init_db,
     create_user,
     find_user_by_email,
     find_user_by_id,
+    update_user_password,
     save_optimization,
     get_user_optimizations,
     get_optimization_by_id,
@@ -43,7 +77,7 @@ from database import (
     toggle_star,
     get_user_stats,
 )
-from core.pipeline import run_pipeline
+from core.pipeline import run_pipeline, run_pipeline_sync
 
 import os
 from dotenv import load_dotenv
@@ -53,44 +87,186 @@ load_dotenv()
 # APP SETUP
 # ─────────────────────────────────────────────────────────────────────────────
 
+def _json_bytes(obj) -> bytes:
+    """orjson encoding shared by ORJSONProvider and the streamed responses."""
+    return orjson.dumps(obj, default=DefaultJSONProvider.default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (used by jsonify and get_json)."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return _json_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+
+# Number of reverse proxies / load balancers in front of the app. Needed so
+# request.remote_addr is the real client (per-IP auth limits depend on it);
+# leave at 0 when clients connect directly, or X-Forwarded-For is spoofable.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+# Brotli/gzip for JSON bodies — code blobs and repeated history keys compress
+# very well. Streamed responses (/api/history) are compressed chunk by chunk.
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+app.config["COMPRESS_MIN_SIZE"]  = 512
+app.config["COMPRESS_STREAMS"]   = True
+Compress(app)
+
 JWT_SECRET  = os.getenv("JWT_SECRET_KEY", "change_this_in_production")
 JWT_ALGO    = "HS256"
 JWT_EXPIRES = timedelta(days=7)
 
-VALID_LEVELS = {"none", "level1", "level2"}
+# Levels are matched after .lower() and dropping "_", so "LEVEL_1" == "level1"
+VALID_LEVELS = frozenset({"none", "level1", "level2"})
 
-_LEVEL_ALIASES = {
-    "LEVEL_1": "level1", "LEVEL_2": "level2",
-    "level_1": "level1", "level_2": "level2",
-}
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX     = 200
+
+# Only CPU-bound levels go to the process pool; level2 runs on _LOOP
+PIPELINE_POOL_LEVELS = frozenset({"none", "level1"})
+PIPELINE_WORKERS     = max(2, (os.cpu_count() or 2) - 1)
+PIPELINE_TIMEOUT     = float(os.getenv("PIPELINE_TIMEOUT", 60))
+
+# Argon2id via the native argon2-cffi binding. Legacy bcrypt hashes ($2b$…)
+# are still accepted at login and transparently re-hashed with argon2.
+_PH = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
+# Shared pool for password hashing/verification. Both KDFs release the GIL in
+# their C code, so this caps concurrent KDF work at one job per core instead
+# of letting a signup burst run one per request thread.
+_HASH_POOL = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 4,
+    thread_name_prefix="pwhash",
+)
+
+# Verified JWT payloads keyed by raw token. The SPA sends the same token on
+# every call, so this skips the HMAC check on almost all requests.
+_JWT_CACHE      = TTLCache(maxsize=10_000, ttl=15)
+_JWT_CACHE_LOCK = threading.Lock()
+
+# Cap on simultaneous register/login requests per client IP, so one client
+# can't occupy the whole _HASH_POOL with a burst of password attempts.
+AUTH_MAX_INFLIGHT_PER_IP = 4
+_AUTH_INFLIGHT: dict[str, int] = {}
+_AUTH_INFLIGHT_LOCK = threading.Lock()
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # HELPERS
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _run_async(coro):
-    loop = asyncio.new_event_loop()
+# Worker processes for run_pipeline. Each job runs run_pipeline_sync in a
+# worker, so a slow or memory-hungry analysis only ties up that process.
+# Workers are started lazily from request threads, and forking a process
+# that already runs threads (hash pool, save writer, PyMongo monitors) can
+# deadlock the child — so never use the "fork" start method here. The
+# forkserver preloads only core.pipeline, not this module (its default is to
+# import __main__, i.e. the whole app).
+_PIPELINE_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+if _PIPELINE_MP_CONTEXT.get_start_method() == "forkserver":
+    _PIPELINE_MP_CONTEXT.set_forkserver_preload(["core.pipeline"])
+_PIPELINE_POOL      = ProcessPoolExecutor(max_workers=PIPELINE_WORKERS, mp_context=_PIPELINE_MP_CONTEXT)
+_PIPELINE_POOL_LOCK = threading.Lock()
+
+
+# One long-lived event loop on a daemon thread for the I/O-bound level2
+# pipeline; request threads hand their coroutines to it instead of building
+# and tearing down a loop per call. Started in STARTUP below.
+_LOOP = asyncio.new_event_loop()
+
+
+def _run_pipeline(pool: ProcessPoolExecutor, code: str, optimization_level: str) -> dict | None:
+    """Run the pipeline for one request. Returns None if it timed out."""
+    if optimization_level in PIPELINE_POOL_LEVELS:
+        future = pool.submit(run_pipeline_sync, code, optimization_level)
+    else:
+        future = asyncio.run_coroutine_threadsafe(run_pipeline(code, optimization_level), _LOOP)
     try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+        return future.result(timeout=PIPELINE_TIMEOUT)
+    except FutureTimeoutError:
+        if future.done():
+            # The pipeline itself raised TimeoutError (same class on 3.11+)
+            return future.result()
+        future.cancel()  # drops a queued pool job / cancels the level2 task
+        return None
+
+
+def _reset_pipeline_pool(broken: ProcessPoolExecutor) -> None:
+    """Replace the pool after a worker died (e.g. OOM-killed)."""
+    global _PIPELINE_POOL
+    with _PIPELINE_POOL_LOCK:
+        if _PIPELINE_POOL is broken:
+            _PIPELINE_POOL = ProcessPoolExecutor(
+                max_workers=PIPELINE_WORKERS, mp_context=_PIPELINE_MP_CONTEXT,
+            )
+    broken.shutdown(wait=False, cancel_futures=True)
 
 
 def _error(message: str, status: int = 400):
     return jsonify({"error": message}), status
 
 
-def _make_token(user_id: str, name: str, email: str) -> str:
+def _oid(value: str) -> ObjectId | None:
+    """Parse a client-supplied session id; None if it is not a valid ObjectId."""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+@cache
+def _dummy_hash() -> str:
+    """
+    Hash verified against when a login email is unknown, so both failure
+    paths cost one KDF run and response time doesn't reveal which emails
+    are registered. Built on first use, not at import. Accounts still on a
+    legacy bcrypt hash verify with bcrypt instead, so they remain
+    distinguishable by timing until their first login migrates them.
+    """
+    return _PH.hash("opticode-dummy-password")
+
+
+def _hash_password(password: str) -> str:
+    return _HASH_POOL.submit(_PH.hash, password).result()
+
+
+def _verify_password(stored_hash: str, password: str) -> bool:
+    return _HASH_POOL.submit(_verify_password_sync, stored_hash, password).result()
+
+
+def _verify_password_sync(stored_hash: str, password: str) -> bool:
+    if stored_hash.startswith("$2"):
+        return bcrypt.checkpw(password.encode(), stored_hash.encode())
+    try:
+        return _PH.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def _needs_rehash(stored_hash: str) -> bool:
+    return stored_hash.startswith("$2") or _PH.check_needs_rehash(stored_hash)
+
+
+def _make_token(user_id: str, name: str, email: str, created_at: str | None) -> str:
+    now = datetime.now(timezone.utc)
     payload = {
-        "sub":   user_id,
-        "name":  name,
-        "email": email,
-        "iat":   datetime.now(timezone.utc),
-        "exp":   datetime.now(timezone.utc) + JWT_EXPIRES,
+        "sub":        user_id,
+        "name":       name,
+        "email":      email,
+        "created_at": created_at,
+        "iat":        now,
+        "exp":        now + JWT_EXPIRES,
     }
     return pyjwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGO)
 
@@ -102,24 +278,52 @@ def require_auth(f):
         if not auth_header.startswith("Bearer "):
             return _error("Missing or invalid Authorization header", 401)
         token = auth_header.split(" ", 1)[1]
-        try:
-            payload = pyjwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
-        except pyjwt.ExpiredSignatureError:
-            return _error("Token has expired — please log in again", 401)
-        except pyjwt.InvalidTokenError:
-            return _error("Invalid token", 401)
+        with _JWT_CACHE_LOCK:
+            payload = _JWT_CACHE.get(token)
+        if payload is None or payload.get("exp", 0) <= time.time():
+            try:
+                payload = pyjwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
+            except pyjwt.ExpiredSignatureError:
+                return _error("Token has expired — please log in again", 401)
+            except pyjwt.InvalidTokenError:
+                return _error("Invalid token", 401)
+            with _JWT_CACHE_LOCK:
+                _JWT_CACHE[token] = payload
         g.user_id    = payload["sub"]
         g.user_name  = payload.get("name", "")
         g.user_email = payload.get("email", "")
+        g.user_since = payload.get("created_at")
         return f(*args, **kwargs)
     return wrapper
 
 
+def limit_auth_concurrency(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        ip = request.remote_addr or ""
+        with _AUTH_INFLIGHT_LOCK:
+            inflight = _AUTH_INFLIGHT.get(ip, 0)
+            if inflight < AUTH_MAX_INFLIGHT_PER_IP:
+                _AUTH_INFLIGHT[ip] = inflight + 1
+        if inflight >= AUTH_MAX_INFLIGHT_PER_IP:
+            return _error("Too many concurrent auth requests — try again shortly", 429)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            with _AUTH_INFLIGHT_LOCK:
+                if _AUTH_INFLIGHT[ip] <= 1:
+                    del _AUTH_INFLIGHT[ip]
+                else:
+                    _AUTH_INFLIGHT[ip] -= 1
+    return wrapper
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # AUTH ROUTES
 # ─────────────────────────────────────────────────────────────────────────────
 
 @app.route("/api/auth/register", methods=["POST"])
+@limit_auth_concurrency
 def register():
     body     = request.get_json(force=True, silent=True) or {}
     name     = (body.get("name",     "") or "").strip()
@@ -131,21 +335,22 @@ def register():
     if len(password) < 6:
         return _error("Password must be at least 6 characters")
 
-    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(12)).decode()
+    hashed = _hash_password(password)
 
     try:
         user = create_user(name, email, hashed)
-    except Exception as e:
-        if "duplicate" in str(e).lower() or "11000" in str(e):
-            return _error("An account with that email already exists", 409)
+    except DuplicateKeyError:
+        return _error("An account with that email already exists", 409)
+    except Exception:
         traceback.print_exc()
         return _error("Could not create account", 500)
 
-    token = _make_token(user["_id"], user["name"], user["email"])
+    token = _make_token(user["_id"], user["name"], user["email"], user["created_at"])
     return jsonify({"token": token, "user": user}), 201
 
 
 @app.route("/api/auth/login", methods=["POST"])
+@limit_auth_concurrency
 def login():
     body     = request.get_json(force=True, silent=True) or {}
     email    = (body.get("email",    "") or "").strip().lower()
@@ -156,23 +361,42 @@ def login():
 
     user_doc = find_user_by_email(email)
     if not user_doc:
+        _verify_password(_dummy_hash(), password)
         return _error("Invalid email or password", 401)
 
-    if not bcrypt.checkpw(password.encode(), user_doc["password"].encode()):
+    if not _verify_password(user_doc["password"], password):
         return _error("Invalid email or password", 401)
 
+    if _needs_rehash(user_doc["password"]):
+        try:
+            update_user_password(user_doc["_id"], _hash_password(password))
+        except Exception:
+            traceback.print_exc()
+
+    created_at = user_doc.get("created_at")
     user = {
-        "_id":   str(user_doc["_id"]),
-        "name":  user_doc["name"],
-        "email": user_doc["email"],
+        "_id":        str(user_doc["_id"]),
+        "name":       user_doc["name"],
+        "email":      user_doc["email"],
+        "created_at": created_at.isoformat() if created_at else None,
     }
-    token = _make_token(user["_id"], user["name"], user["email"])
+    token = _make_token(user["_id"], user["name"], user["email"], user["created_at"])
     return jsonify({"token": token, "user": user}), 200
 
 
 @app.route("/api/auth/me", methods=["GET"])
 @require_auth
 def me():
+    # The token already carries the profile; only hit Mongo when asked to
+    if request.args.get("fresh") != "1":
+        user = {
+            "_id":        g.user_id,
+            "name":       g.user_name,
+            "email":      g.user_email,
+            "created_at": g.user_since,
+        }
+        return jsonify({"user": user}), 200
+
     user = find_user_by_id(g.user_id)
     if not user:
         return _error("User not found", 404)
@@ -195,15 +419,24 @@ def analyse():
         return _error("'code' field is required and must be a non-empty string")
 
     optimization_level = body.get("optimization_level", "none")
-    optimization_level = _LEVEL_ALIASES.get(optimization_level, optimization_level)
+    if not isinstance(optimization_level, str):
+        return _error(f"'optimization_level' must be one of: {sorted(VALID_LEVELS)}")
+    optimization_level = optimization_level.lower().replace("_", "")
     if optimization_level not in VALID_LEVELS:
         return _error(f"'optimization_level' must be one of: {sorted(VALID_LEVELS)}")
 
+    pool = _PIPELINE_POOL
     try:
-        result = _run_async(run_pipeline(code, optimization_level))
+        result = _run_pipeline(pool, code, optimization_level)
+    except BrokenProcessPool:
+        traceback.print_exc()
+        _reset_pipeline_pool(pool)
+        return _error("Internal server error — check server logs for details.", 500)
     except Exception:
         traceback.print_exc()
         return _error("Internal server error — check server logs for details.", 500)
+    if result is None:
+        return _error("Optimization timed out — try a smaller snippet.", 504)
 
     session_id = None
     if result.get("passed_error_check"):
@@ -240,14 +473,51 @@ def analyse():
 @app.route("/api/history", methods=["GET"])
 @require_auth
 def get_history():
-    sessions = get_user_optimizations(g.user_id)
-    return jsonify({"sessions": sessions}), 200
+    try:
+        limit = int(request.args.get("limit", HISTORY_PAGE_DEFAULT))
+    except ValueError:
+        return _error("'limit' must be an integer")
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+
+    before = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        before = _oid(cursor)
+        if before is None:
+            return _error("'cursor' is not a valid session id")
+
+    # The cursor is lazy: pull the first session before committing to a 200
+    # so connection/query errors still surface as a proper 500.
+    try:
+        sessions = get_user_optimizations(g.user_id, limit=limit, before=before)
+        first    = next(sessions, None)
+    except Exception:
+        traceback.print_exc()
+        return _error("Could not load history", 500)
+    if first is not None:
+        sessions = chain((first,), sessions)
+
+    # Stream straight off the Mongo cursor — one session in memory at a time
+    def generate():
+        yield b'{"sessions":['
+        last_id, count = None, 0
+        for session in sessions:
+            yield (b"," if count else b"") + _json_bytes(session)
+            last_id = session["_id"]
+            count  += 1
+        next_cursor = last_id if count == limit else None
+        yield b'],"next_cursor":' + _json_bytes(next_cursor) + b"}"
+
+    return Response(generate(), mimetype="application/json"), 200
 
 
 @app.route("/api/history/<session_id>", methods=["DELETE"])
 @require_auth
 def delete_session(session_id: str):
-    success = delete_optimization(session_id, g.user_id)
+    oid = _oid(session_id)
+    if oid is None:
+        return _error("Session not found or not yours", 404)
+    success = delete_optimization(oid, g.user_id)
     if not success:
         return _error("Session not found or not yours", 404)
     return jsonify({"deleted": True}), 200
@@ -256,11 +526,14 @@ def delete_session(session_id: str):
 @app.route("/api/history/<session_id>/rename", methods=["PATCH"])
 @require_auth
 def rename_session(session_id: str):
+    oid = _oid(session_id)
+    if oid is None:
+        return _error("Session not found or not yours", 404)
     body     = request.get_json(force=True, silent=True) or {}
     new_name = (body.get("name", "") or "").strip()
     if not new_name:
         return _error("'name' is required")
-    success = rename_optimization(session_id, g.user_id, new_name)
+    success = rename_optimization(oid, g.user_id, new_name)
     if not success:
         return _error("Session not found or not yours", 404)
     return jsonify({"renamed": True}), 200
@@ -269,7 +542,10 @@ def rename_session(session_id: str):
 @app.route("/api/history/<session_id>/star", methods=["PATCH"])
 @require_auth
 def star_session(session_id: str):
-    new_val = toggle_star(session_id, g.user_id)
+    oid = _oid(session_id)
+    if oid is None:
+        return _error("Session not found or not yours", 404)
+    new_val = toggle_star(oid, g.user_id)
     if new_val is None:
         return _error("Session not found or not yours", 404)
     return jsonify({"starred": new_val}), 200
@@ -295,6 +571,17 @@ def health():
     return jsonify({"status": "ok"}), 200
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# STARTUP
+# ─────────────────────────────────────────────────────────────────────────────
+
+# Pipeline workers (spawn / forkserver) re-import this file as "__mp_main__"
+# only to unpickle jobs; they must not connect to Mongo or start threads.
+if __name__ != "__mp_main__":
+    init_db()
+    threading.Thread(target=_LOOP.run_forever, name="async-loop", daemon=True).start()
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # ENTRY POINT
 # ─────────────────────────────────────────────────────────────────────────────
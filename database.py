@@ -8,9 +8,19 @@ users          — one document per registered account
 optimizations  — one document per optimization run, linked to a user via user_id
 """
 
-from pymongo import MongoClient, DESCENDING
-from pymongo.errors import DuplicateKeyError
-from datetime import datetime
+import queue
+import threading
+import traceback
+from collections.abc import Iterator
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import zstandard as zstd
+from cachetools import TTLCache
+
+from pymongo import MongoClient, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+from datetime import datetime, timezone
 from bson import ObjectId
 import os
 from dotenv import load_dotenv
@@ -23,17 +33,85 @@ load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/opticode")
 
-client = MongoClient(MONGO_URI)
-db     = client.get_database()
+# Set by init_db(). Nothing connects at import time, so processes that only
+# import this module indirectly (pipeline workers) never open a pool.
+client                   = None
+db                       = None
+users_collection         = None
+optimizations_collection = None
 
-users_collection         = db["users"]
-optimizations_collection = db["optimizations"]
+_INIT_LOCK = threading.Lock()
 
-# Unique index on email — two accounts can't share one address
-users_collection.create_index("email", unique=True)
 
-# Compound index so history queries (user_id + date sort) are fast
-optimizations_collection.create_index([("user_id", 1), ("created_at", DESCENDING)])
+def init_db() -> None:
+    """
+    Connect to MongoDB, ensure indexes and start the save writer thread.
+    Safe to call more than once; only the first call does anything.
+    """
+    global client, db, users_collection, optimizations_collection
+    with _INIT_LOCK:
+        if client is not None:
+            return
+
+        # One pool per process. MongoClient is not fork-safe: under
+        # gunicorn/uwsgi keep app preloading off so each worker builds its
+        # own pool after forking.
+        client = MongoClient(
+            MONGO_URI,
+            maxPoolSize              = 200,
+            minPoolSize              = 10,
+            maxIdleTimeMS            = 300_000,
+            serverSelectionTimeoutMS = 3_000,
+            socketTimeoutMS          = 10_000,
+            retryWrites              = True,
+            compressors              = "zstd,zlib",
+            uuidRepresentation       = "standard",
+            tz_aware                 = True,
+            tzinfo                   = timezone.utc,
+        )
+        db = client.get_database()
+
+        users_collection         = db["users"]
+        optimizations_collection = db["optimizations"]
+
+        # Unique index on email — two accounts can't share one address
+        users_collection.create_index("email", unique=True)
+
+        # Covers every field get_user_stats touches so it runs as an index-only scan
+        optimizations_collection.create_index(
+            [("user_id", 1), ("level", 1), ("starred", 1), ("created_at", DESCENDING)],
+            name="stats_cover",
+        )
+
+        # History is paged newest-first on (user_id, _id). ObjectIds are minted
+        # at save time and lead with a timestamp, so _id order is creation
+        # order (to the second) and one unique key gives a simple keyset
+        # cursor. This replaces the old (user_id, created_at) history index.
+        optimizations_collection.create_index([("user_id", 1), ("_id", DESCENDING)])
+
+        threading.Thread(target=_save_writer, name="save-writer", daemon=True).start()
+
+# Code blobs are stored zstd-compressed under "<field>_z". Documents written
+# before compression keep the plain "<field>" string and are read as-is.
+# zstd contexts must not be shared between threads, so each request thread
+# lazily builds its own compressor/decompressor pair.
+_ZSTD_LOCAL = threading.local()
+
+
+# Per-process cache of get_user_stats results, dropped on every write that
+# changes them (save / delete / star). Multi-worker deployments only see
+# their own invalidations, hence the short TTL.
+_STATS_CACHE      = TTLCache(maxsize=10_000, ttl=60)
+_STATS_CACHE_LOCK = threading.Lock()
+
+# Bumped by every invalidation. get_user_stats only caches its result if the
+# user's generation is unchanged since it started reading, so an aggregation
+# that raced with a write can't re-insert stale stats after invalidation.
+# Entries outlive the stats TTL, which is far longer than any aggregation.
+_STATS_GENERATION = TTLCache(maxsize=100_000, ttl=120)
+
+# (minute since epoch, formatted default session name) — see _session_name
+_SESSION_NAME_CACHE: tuple[int, str] = (-1, "")
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -52,6 +130,25 @@ def _serialize_user(doc: dict) -> dict:
     }
 
 
+def _zstd_contexts() -> tuple[zstd.ZstdCompressor, zstd.ZstdDecompressor]:
+    ctx = getattr(_ZSTD_LOCAL, "ctx", None)
+    if ctx is None:
+        ctx = _ZSTD_LOCAL.ctx = (zstd.ZstdCompressor(level=3), zstd.ZstdDecompressor())
+    return ctx
+
+
+def _compress_code(code: str) -> bytes:
+    return _zstd_contexts()[0].compress(code.encode())
+
+
+def _read_code(doc: dict, field: str) -> str:
+    """Return a code field, decompressing "<field>_z" when that is what's stored."""
+    if field in doc:
+        return doc[field]
+    blob = doc.get(f"{field}_z")
+    return _zstd_contexts()[1].decompress(blob).decode() if blob is not None else ""
+
+
 def _serialize_optimization(doc: dict) -> dict:
     """Convert a raw MongoDB optimization document to a JSON-safe dict."""
     if doc is None:
@@ -60,8 +157,8 @@ def _serialize_optimization(doc: dict) -> dict:
         "_id":                str(doc["_id"]),
         "user_id":            doc.get("user_id", ""),
         "name":               doc.get("name", ""),
-        "original_code":      doc.get("original_code", ""),
-        "optimized_code":     doc.get("optimized_code", ""),
+        "original_code":      _read_code(doc, "original_code"),
+        "optimized_code":     _read_code(doc, "optimized_code"),
         "level":              doc.get("level", "none"),
         "changes":            doc.get("changes", []),
         "original_analysis":  doc.get("original_analysis"),
@@ -72,6 +169,23 @@ def _serialize_optimization(doc: dict) -> dict:
     }
 
 
+def _session_name(now: datetime) -> str:
+    """Default session name; strftime runs at most once per wall-clock minute."""
+    global _SESSION_NAME_CACHE
+    minute = int(now.timestamp()) // 60
+    cached_minute, name = _SESSION_NAME_CACHE
+    if cached_minute != minute:
+        name = f"Session · {now.strftime('%d %b %Y, %H:%M')}"
+        _SESSION_NAME_CACHE = (minute, name)
+    return name
+
+
+def _invalidate_stats(user_id: str) -> None:
+    with _STATS_CACHE_LOCK:
+        _STATS_CACHE.pop(user_id, None)
+        _STATS_GENERATION[user_id] = _STATS_GENERATION.get(user_id, 0) + 1
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # USER OPERATIONS
 # ─────────────────────────────────────────────────────────────────────────────
@@ -86,7 +200,7 @@ def create_user(name: str, email: str, hashed_password: str) -> dict:
         "name":       name,
         "email":      email.lower().strip(),
         "password":   hashed_password,
-        "created_at": datetime.utcnow(),
+        "created_at": datetime.now(timezone.utc),
     }
     result = users_collection.insert_one(doc)
     doc["_id"] = str(result.inserted_id)
@@ -107,10 +221,88 @@ def find_user_by_id(user_id: str) -> dict | None:
     return _serialize_user(doc)
 
 
+def update_user_password(user_id: ObjectId, hashed_password: str) -> None:
+    """Replace the stored password hash (used when upgrading legacy hashes)."""
+    users_collection.update_one(
+        {"_id": user_id},
+        {"$set": {"password": hashed_password}},
+    )
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # OPTIMIZATION HISTORY OPERATIONS
 # ─────────────────────────────────────────────────────────────────────────────
 
+# Group commit for save_optimization: request threads enqueue their document
+# and block on a Future; a single writer thread takes everything that queued
+# up while the previous insert was in flight and writes it with one
+# insert_many. Under a burst of saves that is one roundtrip instead of N;
+# an isolated save goes out immediately. A caller that waits longer than
+# _SAVE_TIMEOUT (writer stuck or dead) inserts its own document directly.
+_SAVE_QUEUE: "queue.SimpleQueue[tuple[dict, Future]]" = queue.SimpleQueue()
+_SAVE_BATCH_MAX = 100
+_SAVE_TIMEOUT   = 15  # seconds; above socketTimeoutMS so one slow insert fits
+
+
+def _insert_one_idempotent(doc: dict) -> None:
+    """
+    Insert a document whose _id is already assigned. A duplicate-key error on
+    _id means an earlier attempt already wrote it, so that counts as success.
+    """
+    try:
+        optimizations_collection.insert_one(doc)
+    except DuplicateKeyError as e:
+        if "_id" not in (e.details or {}).get("keyPattern", {"_id": 1}):
+            raise
+
+
+def _write_error(err: dict) -> WriteError:
+    """Build the error for one writeErrors entry of a BulkWriteError."""
+    cls = DuplicateKeyError if err.get("code") == 11000 else WriteError
+    return cls(err.get("errmsg", "write failed"), err.get("code"), err)
+
+
+def _write_batch(batch: list[tuple[dict, Future]]) -> None:
+    failed: dict[int, Exception] = {}
+    try:
+        optimizations_collection.insert_many([doc for doc, _ in batch], ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"]: _write_error(err) for err in e.details.get("writeErrors", [])}
+    except Exception:
+        # Batch-level failure (oversized/invalid document, network error):
+        # retry one by one so each error reaches only its own caller.
+        for i, (doc, _) in enumerate(batch):
+            try:
+                _insert_one_idempotent(doc)
+            except Exception as e:
+                failed[i] = e
+
+    for i, (_, future) in enumerate(batch):
+        if i in failed:
+            future.set_exception(failed[i])
+        else:
+            future.set_result(None)
+
+
+def _save_writer() -> None:
+    while True:
+        batch = [_SAVE_QUEUE.get()]
+        while len(batch) < _SAVE_BATCH_MAX:
+            try:
+                batch.append(_SAVE_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+
+        # Never let one bad batch kill the only writer thread
+        try:
+            _write_batch(batch)
+        except BaseException as e:
+            traceback.print_exc()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e if isinstance(e, Exception) else RuntimeError(str(e)))
+
+
 def save_optimization(
     user_id:            str,
     original_code:      str,
@@ -122,83 +314,119 @@ def save_optimization(
     error:              str | None = None,
 ) -> dict:
     """Persist one optimization run for a user."""
-    name = f"Session · {datetime.utcnow().strftime('%d %b %Y, %H:%M')}"
+    now  = datetime.now(timezone.utc)
+    name = _session_name(now)
 
     doc = {
         "user_id":            user_id,
         "name":               name,
-        "original_code":      original_code,
-        "optimized_code":     optimized_code,
+        "original_code_z":    _compress_code(original_code),
+        "optimized_code_z":   _compress_code(optimized_code),
         "level":              level,
         "changes":            changes,
         "original_analysis":  original_analysis,
         "optimized_analysis": optimized_analysis,
         "error":              error,
         "starred":            False,
-        "created_at":         datetime.utcnow(),
+        "created_at":         now,
+        # Fixed up front so a retry after a partial or timed-out write is safe
+        "_id":                ObjectId(),
     }
 
-    result = optimizations_collection.insert_one(doc)
-    doc["_id"] = str(result.inserted_id)
-    return _serialize_optimization(doc)
+    future: Future = Future()
+    _SAVE_QUEUE.put((doc, future))
+    try:
+        future.result(timeout=_SAVE_TIMEOUT)  # re-raises the insert error, if any
+    except FutureTimeoutError:
+        if future.done():
+            future.result()
+        _insert_one_idempotent(doc)
+    _invalidate_stats(user_id)
+
+    # The writer may still hold `doc`, so serialize from a copy
+    return _serialize_optimization({
+        **doc,
+        "_id":            str(doc["_id"]),
+        "original_code":  original_code,
+        "optimized_code": optimized_code,
+    })
 
 
-def get_user_optimizations(user_id: str) -> list:
-    """Return all optimization sessions for user_id, newest first."""
-    cursor = optimizations_collection.find(
-        {"user_id": user_id}
-    ).sort("created_at", DESCENDING)
+def get_user_optimizations(
+    user_id: str,
+    limit:   int = 50,
+    before:  ObjectId | None = None,
+) -> Iterator[dict]:
+    """
+    Lazily yield one page of optimization sessions for user_id, newest first
+    (ordered by _id, i.e. creation order — see the index in init_db).
+
+    before  — _id of the last session on the previous page (keyset cursor).
+    """
+    query = {"user_id": user_id}
+    if before is not None:
+        query["_id"] = {"$lt": before}
+
+    cursor = optimizations_collection.find(query).sort("_id", DESCENDING).limit(limit)
 
-    return [_serialize_optimization(doc) for doc in cursor]
+    return (_serialize_optimization(doc) for doc in cursor)
 
 
-def get_optimization_by_id(optimization_id: str, user_id: str) -> dict | None:
+def get_optimization_by_id(optimization_id: ObjectId, user_id: str) -> dict | None:
     """Fetch a single session, enforcing user_id ownership check."""
     doc = optimizations_collection.find_one({
-        "_id":     ObjectId(optimization_id),
+        "_id":     optimization_id,
         "user_id": user_id,
     })
     return _serialize_optimization(doc)
 
 
-def delete_optimization(optimization_id: str, user_id: str) -> bool:
+def delete_optimization(optimization_id: ObjectId, user_id: str) -> bool:
     """Delete a session. Returns True if something was deleted."""
     result = optimizations_collection.delete_one({
-        "_id":     ObjectId(optimization_id),
+        "_id":     optimization_id,
         "user_id": user_id,
     })
+    if result.deleted_count:
+        _invalidate_stats(user_id)
     return result.deleted_count > 0
 
 
-def rename_optimization(optimization_id: str, user_id: str, new_name: str) -> bool:
+def rename_optimization(optimization_id: ObjectId, user_id: str, new_name: str) -> bool:
     """Rename a session. Returns True on success."""
     result = optimizations_collection.update_one(
-        {"_id": ObjectId(optimization_id), "user_id": user_id},
+        {"_id": optimization_id, "user_id": user_id},
         {"$set": {"name": new_name}},
     )
     return result.modified_count > 0
 
 
-def toggle_star(optimization_id: str, user_id: str) -> bool | None:
+def toggle_star(optimization_id: ObjectId, user_id: str) -> bool | None:
     """Flip the starred flag. Returns the NEW starred value, or None if not found."""
-    doc = optimizations_collection.find_one({
-        "_id":     ObjectId(optimization_id),
-        "user_id": user_id,
-    })
-    if not doc:
-        return None
-    new_val = not doc.get("starred", False)
-    optimizations_collection.update_one(
-        {"_id": ObjectId(optimization_id)},
-        {"$set": {"starred": new_val}},
+    # Pipeline update so the flip happens atomically in a single roundtrip
+    doc = optimizations_collection.find_one_and_update(
+        {"_id": optimization_id, "user_id": user_id},
+        [{"$set": {"starred": {"$not": [{"$ifNull": ["$starred", False]}]}}}],
+        projection={"starred": 1},
+        return_document=ReturnDocument.AFTER,
     )
-    return new_val
+    if doc is None:
+        return None
+    _invalidate_stats(user_id)
+    return doc["starred"]
 
 
 def get_user_stats(user_id: str) -> dict:
     """Aggregate stats for the Profile page using MongoDB aggregation pipeline."""
+    with _STATS_CACHE_LOCK:
+        cached     = _STATS_CACHE.get(user_id)
+        generation = _STATS_GENERATION.get(user_id, 0)
+    if cached is not None:
+        return dict(cached)
+
     pipeline = [
         {"$match": {"user_id": user_id}},
+        {"$project": {"_id": 0, "level": 1, "starred": 1, "created_at": 1}},
         {"$group": {
             "_id":           None,
             "total":         {"$sum": 1},
@@ -212,16 +440,21 @@ def get_user_stats(user_id: str) -> dict:
     results = list(optimizations_collection.aggregate(pipeline))
 
     if not results:
-        return {
+        stats = {
             "total": 0, "level1_count": 0, "level2_count": 0,
             "starred_count": 0, "last_active": None,
         }
+    else:
+        row = results[0]
+        stats = {
+            "total":         row["total"],
+            "level1_count":  row["level1_count"],
+            "level2_count":  row["level2_count"],
+            "starred_count": row["starred_count"],
+            "last_active":   row["last_active"].isoformat() if row.get("last_active") else None,
+        }
 
-    row = results[0]
-    return {
-        "total":         row["total"],
-        "level1_count":  row["level1_count"],
-        "level2_count":  row["level2_count"],
-        "starred_count": row["starred_count"],
-        "last_active":   row["last_active"].isoformat() if row.get("last_active") else None,
-    }
\ No newline at end of file
+    with _STATS_CACHE_LOCK:
+        if _STATS_GENERATION.get(user_id, 0) == generation:
+            _STATS_CACHE[user_id] = stats
+    return dict(stats)
\ No newline at end of file